@@ -9,6 +9,7 @@ from classes.Matcher import URAProteomeMatcher
 from classes.Log import Logger
 from classes.Config import Config
 from classes.UI import *
+from tkinter import Tk, Frame, Button, X, EW
 
 def arg_parser():
       """ Defines named arguments, provides the --help/-h flag, and allows the option to use required arguments """
@@ -19,7 +20,7 @@ def arg_parser():
       parser.add_argument('-ipn', '--ignore-protein-name-matches', help = 'OPTIONAL: Only match Genes, ignore Protein_Names matches', action = 'store_true')
       parser.add_argument('-ll', '--log-level', help = 'OPTIONAL: Log level, defaults to INFO', nargs = '?', type = str, required = False, default='INFO')
       parser.add_argument('-lf', '--log-to-file', help = 'OPTIONAL: Log to file, defaults to False', action = 'store_true')
-      parser.add_argument('-of', '--out-file', help = 'OPTIONAL: Local file to output results to', nargs = '?', type = str, required = False)
+      parser.add_argument('-of', '--out-file', help = 'OPTIONAL: Local file to output results to, written as parquet if it ends in .parquet, otherwise as CSV', nargs = '?', type = str, required = False)
       return parser.parse_args()
 
 def main(args):
@@ -32,13 +33,14 @@ def main(args):
     # load input files
     print('\n--- load files ---\n')
     proteome_data = matcher.load_proteome_data(args.proteome_data_file)
-    upstream_regulators = matcher.load_upstream_regulators(args.upstream_regulator_file)
+    matcher.load_upstream_regulators(args.upstream_regulator_file)
     group_data = matcher.load_group_data(args.upstream_regulator_group_file)
 
     # drop match columns from source dataframe if they are present
     print('\n--- drop old match column results (if present) ---\n')
     match_columns = ['UR_EXACT_MATCH', 'UR_GROUP_MATCH', 'UR_BEST_MATCH']
-    matcher.drop_columns(proteome_data, match_columns)
+    predic_columns = ['EXACT_MATCH_PREDIC', 'BEST_MATCH_PREDIC']
+    matcher.drop_columns(proteome_data, match_columns + predic_columns)
 
     # validate proteome data, confirm expected columns are present
     print('\n--- validate proteome data has expected columns ---\n')
@@ -50,38 +52,25 @@ def main(args):
 
     # find URs for exact, group, and best match columns
     print('\n--- look for matches, generate match data ---\n')
+    ur_exact_matches = matcher.get_ur_exact_matches(proteome_data, ignore_protein_name_matches=args.ignore_protein_name_matches)
+
+    # find the predicted activation state for the UR EXACT_MATCH and BEST_MATCH columns in the same pass
     match_data = []
-    ## error handle this in case protein names isnt present
-    for index, row in proteome_data.iterrows():
-        genes = row.get('Genes', '').split(';')
-        protein_names = row.get('Protein_Names', '').split(';')
+    genes_col = proteome_data['Genes'].fillna('').str.split(';').to_numpy()
+    for index, genes, row_exact_matches in zip(proteome_data.index, genes_col, ur_exact_matches):
+        ur_group_matches = matcher.get_ur_group_matches(index, group_data=group_data, genes=genes)
+        ur_best_matches = matcher.get_ur_best_matches(index, row_exact_matches, ur_group_matches)
 
-        ur_exact_matches = matcher.get_ur_exact_matches(index, upstream_regulators, genes, protein_names, args.ignore_protein_name_matches)
-        ur_group_matches = matcher.get_ur_group_matches(index,upstream_regulators, group_data, genes)
-        ur_best_matches = matcher.get_ur_best_matches(index, ur_exact_matches, ur_group_matches)
+        # most rows have no matches, skip the prediction lookups for those
+        ur_em_predictions = matcher.get_em_predictions(index, exact_match_urs=row_exact_matches) if row_exact_matches else []
+        ur_bm_predictions = matcher.get_bm_predictions(index, best_match_urs=ur_best_matches) if ur_best_matches else []
 
-        match_data.append([';'.join(ur_exact_matches), ';'.join(ur_group_matches), ';'.join(ur_best_matches)])
+        match_data.append([';'.join(row_exact_matches), ';'.join(ur_group_matches), ';'.join(ur_best_matches), ';'.join(ur_em_predictions), ';'.join(ur_bm_predictions)])
 
-    # write match data to the proteome data
+    # write match and prediction data to the proteome data
     print('\n--- update proteome data with matches---\n')
-    updated_proteome_data = matcher.update_proteome_data(proteome_data, match_columns, match_data)    
-    
-
-    # find the predicted activation state for your UR EXACT_MATCH and BEST_MATCH columns
-    prediction_data = []
-    for index, row in updated_proteome_data.iterrows():
-        exact_match_urs = row.get('UR_EXACT_MATCH', '').split(';')
-        ur_em_predictions = matcher.get_em_predictions(index, upstream_regulators, exact_match_urs)
-        
-        best_match_urs = row.get('UR_BEST_MATCH', '').split(';')
-        ur_bm_predictions = matcher.get_bm_predictions(index, upstream_regulators, best_match_urs)
-        
-        prediction_data.append([';'.join(ur_em_predictions), ';'.join(ur_bm_predictions)])
-    
-    predic_columns = ['EXACT_MATCH_PREDIC', 'BEST_MATCH_PREDIC']
-    proteome_data_with_predicts = matcher.update_proteome_data(updated_proteome_data, predic_columns, prediction_data)  
+    proteome_data_with_predicts = matcher.update_proteome_data(proteome_data, match_columns + predic_columns, match_data)
 
-        
     # write the updated proteome data to a file
     print('\n--- write updated proteome data to file ---\n')
     out_file = os.path.abspath(args.out_file or f'URAProteomeMatcher_OUT_{current_time}.csv')
@@ -94,29 +83,27 @@ def ui_main():
     frame = Frame(root)
     frame.pack(fill=X)
 
-    pd_entry = create_entry(frame, '')
-    pd_button = create_button(frame, 'Select Proteome CSV File', get_file_path, pd_entry)
-
-    ur_entry = create_entry(frame, '')
-    ur_button = create_button(frame, 'Select Upstream Regulator Data', get_file_path, ur_entry)
-
-    urg_entry = create_entry(frame, '')
-    urg_button = create_button(frame, 'Select Upstream Regulator Group Reference', get_file_path, urg_entry)
-
-    of_entry = create_entry(frame, '')
-    of_label = create_label(frame, 'Output CSV File Name (Optional)')
-
-    ll = create_optionmenu(frame, ['info', 'debug'])
-    ipnm = create_checkbox(frame, 'Ignore Protein Name Matches')
+    form = build_form(frame, [
+        {'name': 'pd_entry', 'widget': 'entry', 'text': ''},
+        {'widget': 'button', 'text': 'Select Proteome CSV File', 'function': get_file_path, 'vars': 'pd_entry'},
+        {'name': 'ur_entry', 'widget': 'entry', 'text': ''},
+        {'widget': 'button', 'text': 'Select Upstream Regulator Data', 'function': get_file_path, 'vars': 'ur_entry'},
+        {'name': 'urg_entry', 'widget': 'entry', 'text': ''},
+        {'widget': 'button', 'text': 'Select Upstream Regulator Group Reference', 'function': get_file_path, 'vars': 'urg_entry'},
+        {'name': 'of_entry', 'widget': 'entry', 'text': ''},
+        {'widget': 'label', 'text': 'Output CSV File Name (Optional)'},
+        {'name': 'll', 'widget': 'optionmenu', 'options': ['info', 'debug']},
+        {'name': 'ipnm', 'widget': 'checkbox', 'text': 'Ignore Protein Name Matches'}
+    ])
 
     def on_submit():
         ui_config = {
-            'proteome_data_file': pd_entry.get(),
-            'upstream_regulator_file': ur_entry.get(),
-            'upstream_regulator_group_file': urg_entry.get(),
-            'out_file': of_entry.get() or None,
-            'log_level': ll.get() or 'info',
-            'ignore_protein_name_matches': ipnm.get(),
+            'proteome_data_file': form['pd_entry'].get(),
+            'upstream_regulator_file': form['ur_entry'].get(),
+            'upstream_regulator_group_file': form['urg_entry'].get(),
+            'out_file': form['of_entry'].get() or None,
+            'log_level': form['ll'].get() or 'info',
+            'ignore_protein_name_matches': form['ipnm'].get(),
             'log_to_file': False # Turned off due to error on Windows
         }
         config = Config()
@@ -131,7 +118,7 @@ def ui_main():
 
 
     submit_button = Button(frame, text='Submit', command=on_submit)
-    submit_button.pack(fill=X)
+    submit_button.grid(row=frame.grid_size()[1], column=0, sticky=EW)
 
     frame.mainloop()
 
@@ -4,7 +4,6 @@ import os
 import json
 import pandas as pd
 import logging
-import re
 
 from tabulate import tabulate
 
@@ -15,6 +14,10 @@ class URAProteomeMatcher():
 
     def __init__(self, logger=logging.getLogger(__name__)):
         self.logger = logger
+        self._index_upstream_regulators({})
+        self._group_data = None
+        self._group_match_urs = None
+        self._group_match_cache = {}
 
     def load_proteome_data(self, proteome_data_file: str):
         """
@@ -50,9 +53,20 @@ class URAProteomeMatcher():
 
         """
         file_path = os.path.abspath(proteome_data_file)
-        proteome_data = pd.read_csv(file_path).replace('\xa0', '', regex=True)
+        proteome_data = pd.read_csv(file_path, engine='pyarrow')
+
+        # scrub non-breaking spaces from the text columns only, as a plain substring replace rather than a regex over every cell
+        for column in proteome_data.select_dtypes(include=['object', 'string']).columns:
+            proteome_data[column] = proteome_data[column].str.replace('\xa0', '', regex=False)
+
+        # store the ; separated identifier columns as arrow backed strings, which are more compact and faster to split/match than python objects
+        for column in ('Accession', 'Protein_Names', 'Genes'):
+            if column in proteome_data.columns:
+                proteome_data[column] = proteome_data[column].astype('string[pyarrow]')
+
         self.logger.info(f'LOADED PROTEOME: {file_path}')
-        self.logger.debug('\n' + tabulate(proteome_data, proteome_data.columns, tablefmt='fancy_grid') + '\n')
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('\n' + tabulate(proteome_data, proteome_data.columns, tablefmt='fancy_grid') + '\n')
         return proteome_data
 
     def load_upstream_regulators(self, upstream_regulator_file: str):
@@ -88,7 +102,7 @@ class URAProteomeMatcher():
         file_path = os.path.abspath(upstream_regulator_file)
         
         #when loading the tsv, replace any empty values with a " " (need this to avoid issues later)
-        ur_data = pd.read_csv(file_path, sep="\t").replace({float('nan'): ' '})
+        ur_data = pd.read_csv(file_path, sep="\t", engine='pyarrow').replace({float('nan'): ' '})
 
         self.logger.info(f'LOADED UPSTREAM REGULATORS: {file_path}')
         
@@ -105,11 +119,13 @@ class URAProteomeMatcher():
             Exception("Predicted activation column not identified. Please ensure there is exactly one column named 'prediction'")
          
         #empty values in the predicted activation column mean the UR is not significant or not predicted to be act/inhib. Change to "n.s."
-        ur_data.loc[ur_data[predic_colname] == ' ', predic_colname] = 'n.s.'
+        #depending on the pandas version the pyarrow engine reads them as NaN (replaced with " " above) or "", so match any blank value
+        ur_data.loc[ur_data[predic_colname].astype(str).str.strip() == '', predic_colname] = 'n.s.'
 
         #create a dictionary with the urs as keys and the predicitons as values
         upstream_regulators = ur_data[[ur_colname,predic_colname]].set_index(ur_colname).to_dict()[predic_colname]
-        self.logger.debug('\n' + tabulate({ None : upstream_regulators }, ['UPSTREAM_REGULATORS'], tablefmt='fancy_grid') + '\n')
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('\n' + tabulate({ None : upstream_regulators }, ['UPSTREAM_REGULATORS'], tablefmt='fancy_grid') + '\n')
                 
         #Remove URs that are not significantly activated or inhibited (unless data contains no Activated/Inhibited URs)
         not_significant = [ur for ur,pred in upstream_regulators.items() if pred == 'n.s.']
@@ -120,8 +136,21 @@ class URAProteomeMatcher():
         else:
             self.logger.error('NO UPSTREAM REGULATORS RECOGNIZED AS SIGNIFICANT, SO ALL HAVE BEEN INCLUDED')
         
+        self._index_upstream_regulators(upstream_regulators)
         return upstream_regulators
 
+    def _index_upstream_regulators(self, upstream_regulators: dict):
+        """ Keeps the UR -> prediction dict and builds hash lookups for matching: UR -> UR for Genes, and UR_HUMAN/UR_MOUSE -> UR for Protein_Names """
+        self._ur_pred = upstream_regulators
+        self._ur_keys = frozenset(upstream_regulators)
+        self._gene_map = {ur: ur for ur in upstream_regulators}
+        self._pname_map = {f'{ur}_{species}': ur for ur in upstream_regulators for species in ('HUMAN', 'MOUSE')}
+
+    def _use_upstream_regulators(self, upstream_regulators: dict):
+        """ Re-indexes when a UR dict other than the loaded one is passed to a matching method """
+        if upstream_regulators is not None and upstream_regulators is not self._ur_pred:
+            self._index_upstream_regulators(upstream_regulators)
+
     def load_group_data(self, group_file: str):
         """
         Creates a dictionary of gene groups based on a provided JSON file, e.g.
@@ -142,11 +171,24 @@ class URAProteomeMatcher():
         with open(file_path, 'r') as file:
             group_data = json.load(file)
             self.logger.info(f'LOADED GROUP DATA: {file_path}')
-            self.logger.debug('\n' + tabulate(group_data, group_data.keys(), tablefmt='fancy_grid'))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug('\n' + tabulate(group_data, group_data.keys(), tablefmt='fancy_grid'))
             file.close()
 
+        self._index_group_data(group_data)
         return group_data
 
+    def _index_group_data(self, group_data: dict):
+        """ Builds an inverted index of gene -> groups containing that gene, so group matching only looks at a row's genes """
+        self._group_data = group_data
+        self._group_match_cache = {}
+        self._gene_to_groups = {}
+        for group, group_genes in group_data.items():
+            for gene in group_genes:
+                groups = self._gene_to_groups.setdefault(gene, [])
+                if group not in groups:
+                    groups.append(group)
+
     def validate_proteome_data(self, proteome_data: pd.DataFrame, expected_columns: list):
         """ Confirms that expected columns are present in proteome_data """
         expected_columns = set(expected_columns)
@@ -157,15 +199,16 @@ class URAProteomeMatcher():
 
     def drop_columns(self, dataframe: pd.DataFrame, columns: list):
         """ Drop passed columns if present """
-        for column in columns:
-            if column in dataframe.columns:
+        present = [column for column in columns if column in dataframe.columns]
+        if present:
+            dataframe.drop(columns=present, inplace=True)
+            for column in present:
                 self.logger.info(f'DROPPED COLUMN: {column}')
-                dataframe.drop(column, axis=1)
         self.logger.info('DONE')
 
-    def get_ur_exact_matches(self, index: int, upstream_regulators: dict, genes: list, protein_names: list, ignore_protein_name_matches: bool):
+    def get_ur_exact_matches(self, proteome_data: pd.DataFrame, upstream_regulators: dict=None, ignore_protein_name_matches: bool=False):
         """
-        Looks for upstream regulator matches in a list of genes, and optionally in protein names
+        Looks for upstream regulator matches in the Genes column, and optionally in the Protein_Names column
         For gene matches, the upstream regulator must be an exact match, e.g.
 
             DRD5 (upstream regulator) in HTR1F;DRD5 (genes) = match
@@ -174,22 +217,44 @@ class URAProteomeMatcher():
 
             THRB (upstream regulator) in THRB_HUMAN (protein names) = match
 
+        The whole column is split and matched in one pass, returning a series with a list of matches for each row
         Matches will get written in the UR_EXACT_MATCH column as a ; separated list
+
+        URs come from load_upstream_regulators, passing upstream_regulators is deprecated
         """
-        ur_exact_matches = set()
-        for regulator, predic in upstream_regulators.items():
-            if regulator in genes:
-                self.logger.info(f'ROW {index} UR_EXACT_MATCH {regulator} FOUND IN Genes: {";".join(genes)}')
-                ur_exact_matches.add(regulator)
-            elif f'{regulator}_HUMAN' in protein_names or f'{regulator}_MOUSE' in protein_names:
-                if not ignore_protein_name_matches:
-                    self.logger.info(f'ROW {index} UR_EXACT_MATCH {regulator} FOUND IN Protein_Names: {";".join(protein_names)}')
-                    ur_exact_matches.add(regulator)
-            else:
-                pass
+        self._use_upstream_regulators(upstream_regulators) # deprecated
+
+        # rows only hold a handful of matches, so a list with a membership check is cheaper than a set per row
+        ur_exact_matches = pd.Series([[] for _ in range(len(proteome_data))], index=proteome_data.index, dtype=object)
+        # only look up the matched cell for the log message when it will be written
+        log_matches = self.logger.isEnabledFor(logging.INFO)
+
+        for index, regulator in self._match_tokens(proteome_data['Genes'], self._gene_map).items():
+            if regulator not in ur_exact_matches[index]:
+                if log_matches:
+                    self.logger.info('ROW %s UR_EXACT_MATCH %s FOUND IN Genes: %s', index, regulator, proteome_data.at[index, 'Genes'])
+                ur_exact_matches[index].append(regulator)
+
+        if not ignore_protein_name_matches:
+            for index, regulator in self._match_tokens(proteome_data['Protein_Names'], self._pname_map).items():
+                if regulator not in ur_exact_matches[index]:
+                    if log_matches:
+                        self.logger.info('ROW %s UR_EXACT_MATCH %s FOUND IN Protein_Names: %s', index, regulator, proteome_data.at[index, 'Protein_Names'])
+                    ur_exact_matches[index].append(regulator)
+
         return ur_exact_matches
 
-    def get_ur_group_matches(self, index: int, upstream_regulators: dict, group_data: dict, genes: list):
+    def _match_tokens(self, column: pd.Series, lookup: dict):
+        """
+        Splits a ; separated column into tokens and maps each token to its UR through lookup, dropping tokens without a match
+        Tokens are integer encoded first so each distinct token is only looked up once, the result is a series of URs indexed by row
+        """
+        tokens = column.fillna('').str.split(';').explode()
+        codes, uniques = pd.factorize(tokens)
+        regulators = pd.Series(uniques).map(lookup).to_numpy()[codes]
+        return pd.Series(regulators, index=tokens.index).dropna()
+
+    def get_ur_group_matches(self, index: int, upstream_regulators: dict=None, group_data: dict=None, genes: list=()):
         """
         Looks for group matches based on a provided JSON file containing groups and the gene names within them, e.g.
         {
@@ -204,23 +269,30 @@ class URAProteomeMatcher():
             IL-17R family [IL17RB]
             
         NOTE: if the key is NOT in the upstream regulator data (the tsv file), then it will not be matched. 
-        
+        URs come from load_upstream_regulators, passing upstream_regulators is deprecated
         """
+        self._use_upstream_regulators(upstream_regulators) # deprecated
         group_matches = {}
         if group_data:
-            for group, group_genes in group_data.items():
-                if group in upstream_regulators:
-                    for gene in genes:
-                        if gene in group_genes:
-                            if group not in group_matches.keys():
-                                group_matches[group] = []
-                            self.logger.info(f'ROW {index} UR_GROUP_MATCH {group} [{gene}] FOUND')
-                            group_matches[group].append(gene)
-
-        ur_group_matches = set([f"{k} [{','.join(v)}]" for k, v in group_matches.items()])
+            if group_data is not self._group_data:
+                self._index_group_data(group_data)
+            if self._ur_pred is not self._group_match_urs:
+                self._group_match_urs = self._ur_pred
+                self._group_match_cache = {}
+
+            # rows often repeat the same genes, so the (group, gene) matches are cached by the row's genes
+            genes_key = tuple(genes)
+            if genes_key not in self._group_match_cache:
+                self._group_match_cache[genes_key] = [(group, gene) for gene in genes for group in self._gene_to_groups.get(gene, ()) if group in self._ur_keys]
+
+            for group, gene in self._group_match_cache[genes_key]:
+                self.logger.info('ROW %s UR_GROUP_MATCH %s [%s] FOUND', index, group, gene)
+                group_matches.setdefault(group, []).append(gene)
+
+        ur_group_matches = [f"{k} [{','.join(v)}]" for k, v in group_matches.items()]
         return ur_group_matches
 
-    def get_ur_best_matches(self, index: int, ur_exact_matches: set, ur_group_matches: set):
+    def get_ur_best_matches(self, index: int, ur_exact_matches: list, ur_group_matches: list):
         """
         Writes a match value to the UR_BEST_MATCH column in the following priority:
 
@@ -228,44 +300,59 @@ class URAProteomeMatcher():
         2) UR_GROUP_MATCH
         3) NULL
         """
-        ur_best_matches = set()
+        ur_best_matches = []
         if ur_exact_matches:
-            self.logger.info(f'ROW {index} UR_BEST_MATCH EXACT: {";".join(ur_exact_matches)}')
-            ur_best_matches.update(ur_exact_matches)
+            self.logger.info('ROW %s UR_BEST_MATCH EXACT: %s', index, ';'.join(ur_exact_matches))
+            ur_best_matches.extend(ur_exact_matches)
         elif ur_group_matches:
-            self.logger.info(f'ROW {index} UR_BEST_MATCH GROUP: {";".join(ur_group_matches)}')
-            ur_best_matches.update(ur_group_matches)
+            self.logger.info('ROW %s UR_BEST_MATCH GROUP: %s', index, ';'.join(ur_group_matches))
+            ur_best_matches.extend(ur_group_matches)
         else:
             pass
         return ur_best_matches
 
     def update_proteome_data(self, proteome_data: pd.DataFrame, match_columns: list, match_data: list):
-        """ Merges the proteome_data dataframe with the match data """
-        match_df = pd.DataFrame(columns=match_columns, data=match_data)
-        updated_proteome_data = pd.merge(proteome_data, match_df, left_index=True, right_index=True, how='outer').fillna('')
+        """ Writes the match data into the proteome_data dataframe in place, one column per entry in match_columns """
+        for i, column in enumerate(match_columns):
+            proteome_data[column] = [row[i] for row in match_data]
         self.logger.info('UPDATED PROTEOME WITH URS')
-        self.logger.debug('\n' + tabulate(updated_proteome_data, updated_proteome_data.columns, tablefmt='fancy_grid') + '\n')
-        return updated_proteome_data
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('\n' + tabulate(proteome_data, proteome_data.columns, tablefmt='fancy_grid') + '\n')
+        return proteome_data
     
     
-    def get_em_predictions(self, index: int, upstream_regulators: dict, exact_match_urs: list):
-       predictions = []
-       for regulator, predic in upstream_regulators.items():
-           if regulator in exact_match_urs:
-               predictions.append(predic)
-               self.logger.info(f'ROW {index} UR_EXACT_MATCH {regulator} PREDICTION: {predic}')
-       return predictions
-
-    def get_bm_predictions(self, index: int, upstream_regulators: dict, best_match_urs: list):
+    def get_em_predictions(self, index: int, upstream_regulators: dict=None, exact_match_urs: list=()):
+        """ Looks up the predicted activation state of each UR_EXACT_MATCH regulator, in the same order as the matches """
+        self._use_upstream_regulators(upstream_regulators) # deprecated
+        pred_get = self._ur_pred.get
+        log = self.logger.info
         predictions = []
-        for regulator, predic in upstream_regulators.items():
-            if regulator in [re.sub(r' \[.*\]', '', i) for i in best_match_urs]:
+        for regulator in exact_match_urs:
+            predic = pred_get(regulator)
+            if predic is not None:
                 predictions.append(predic)
-                self.logger.info(f'ROW {index} UR_BEST_MATCH {regulator} PREDICTION: {predic}')
-        return predictions  
-    
+                log('ROW %s UR_EXACT_MATCH %s PREDICTION: %s', index, regulator, predic)
+        return predictions
+
+    def get_bm_predictions(self, index: int, upstream_regulators: dict=None, best_match_urs: list=()):
+        """ Looks up the predicted activation state of each UR_BEST_MATCH regulator, dropping the [genes] suffix of group matches """
+        self._use_upstream_regulators(upstream_regulators) # deprecated
+        pred_get = self._ur_pred.get
+        log = self.logger.info
+        predictions = []
+        for regulator in [i.partition(' [')[0] for i in best_match_urs]:
+            predic = pred_get(regulator)
+            if predic is not None:
+                predictions.append(predic)
+                log('ROW %s UR_BEST_MATCH %s PREDICTION: %s', index, regulator, predic)
+        return predictions
+
 
     def write_dataframe_file(self, dataframe: pd.DataFrame, out_file: str):
+        """ Writes the dataframe to out_file, as zstd compressed parquet if the file ends in .parquet, otherwise as CSV written in chunks """
         OUT_FILE = os.path.abspath(out_file)
-        dataframe.to_csv(OUT_FILE, index=False)
+        if OUT_FILE.lower().endswith('.parquet'):
+            dataframe.to_parquet(OUT_FILE, engine='pyarrow', compression='zstd', index=False)
+        else:
+            dataframe.to_csv(OUT_FILE, index=False, chunksize=65536)
         self.logger.info(f'WROTE FILE TO: {OUT_FILE}')
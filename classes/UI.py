@@ -1,55 +1,213 @@
 #!/usr/bin/python3.13
 
-import json
+import sys
+import atexit
+import functools
+import traceback
 
-from tkinter import *
-from tkinter.filedialog import askopenfilename
+from tkinter import Tk, Label, Entry, Button, OptionMenu, Checkbutton, Toplevel, StringVar, BooleanVar, W, EW, END
+
+# grid options shared by the helpers, built once instead of per call
+_GRID_X = {'column': 0, 'sticky': EW}
+_GRID_WEST = {'column': 0, 'sticky': W, 'padx': 5, 'pady': 5}
+
+# widgets created by the helpers, gridded together by flush_layout
+_pending = []
+
+# hidden root for dialogs opened without a window, see _get_dialog_root
+_dialog_root = None
+
+# root -> (popup, label), the popup window reused by open_popup
+_popup_cache = {}
+
+# parent -> file dialog reused by get_file_path
+_open_dialogs = {}
+
+# id(interpreter) -> {button path: (button, function, vars)}, called through one ura_callback Tcl command per interpreter, see _register_callback
+_callbacks = {}
+
+class WidgetHandle():
+    """ What the create_* helpers return: the widget, and the variable holding its value if it has one """
+    __slots__ = ('widget', 'var')
+
+    def __init__(self, widget, var=None):
+        self.widget = widget
+        self.var = var
+
+    def get(self):
+        """ Returns the current value of the widget's variable, labels and buttons don't have one """
+        if self.var is None:
+            raise TypeError(f'{self.widget.winfo_class()} WIDGET HAS NO VALUE: {self.widget}')
+        return self.var.get()
 
 def create_label(frame, text):
     """ Creates a label """
     label = Label(frame, text=text)
-    label.pack(fill=X)
-    return label
+    _pending.append((label, _GRID_X))
+    return WidgetHandle(label)
 
 def create_entry(frame, text):
-    """ Creates a text entry """
-    entry = Entry(frame)
-    entry.insert(0, text)
-    entry.pack(fill=X)
-    return entry
+    """ Creates a text entry, its text is bound to a StringVar """
+    variable = StringVar(master=frame, value=text)
+    entry = Entry(frame, textvariable=variable)
+    _pending.append((entry, _GRID_X))
+    return WidgetHandle(entry, variable)
 
 def create_button(frame, text, function, vars):
     """ Creates a button that can trigger a specified function """
-    button = Button(frame, text=text, command=lambda:function(vars))
-    button.pack(fill=X)
-    return button
+    button = Button(frame, text=text)
+    button['command'] = _register_callback(button, function, vars)
+    _pending.append((button, _GRID_X))
+    return WidgetHandle(button)
+
+def _register_callback(button, function, vars):
+    """
+    Stores function(vars) in the callback table and returns the Tcl command that runs it, registering ura_callback once per interpreter
+    The entry is released when the button is destroyed, and the interpreter's table once it is empty
+    """
+    interp = id(button.tk)
+    if interp not in _callbacks:
+        _callbacks[interp] = {}
+        button.tk.createcommand('ura_callback', functools.partial(_run_callback, interp))
+    _callbacks[interp][str(button)] = (button, function, vars)
+    # a script binding, so no python command is registered per button
+    button.bind('<Destroy>', '+ura_callback release %W')
+    return f'ura_callback run {button}'
+
+def _run_callback(interp, action, path):
+    """ Runs or releases a callback stored by _register_callback, reporting errors the same way tkinter does for its own callbacks """
+    callbacks = _callbacks.get(interp, {})
+    if action == 'release':
+        callbacks.pop(path, None)
+        if not callbacks:
+            _callbacks.pop(interp, None)
+        return
+    button = None
+    try:
+        button, function, vars = callbacks[path]
+        function(vars)
+    except Exception:
+        # an exception left in the ura_callback command would be re-raised by mainloop and close the UI
+        if button is None:
+            traceback.print_exc()
+        else:
+            button._report_exception()
 
 def create_optionmenu(frame, options):
     """ Creates an option menu """
-    variable = StringVar(value=options[0])
-    optionmenu = OptionMenu(frame, variable, *options)
-    optionmenu.pack(anchor=W, padx=5, pady=5)
-    return variable
+    variable = StringVar(master=frame, value=options[0])
+    optionmenu = OptionMenu(frame, variable, options[0])
+    # add the remaining entries in one Tcl call, each setting the variable directly rather than through a python callback
+    # the labels are passed as Tcl values rather than formatted into the script, so braces, brackets and backslashes in them are kept as is
+    frame.tk.call('apply', ('menu var options', 'foreach option $options {$menu add command -label $option -command [list set $var $option]}'),
+                  optionmenu['menu'], str(variable), tuple(options[1:]))
+    _pending.append((optionmenu, _GRID_WEST))
+    return WidgetHandle(optionmenu, variable)
 
 def create_checkbox(frame, text):
     """ Creates a textbox """
-    variable = BooleanVar(value=False)
+    variable = BooleanVar(master=frame, value=False)
     checkbox = Checkbutton(frame, text=text, variable=variable)
-    checkbox.pack(anchor=W, padx=5, pady=5)
-    return variable
+    _pending.append((checkbox, _GRID_WEST))
+    return WidgetHandle(checkbox, variable)
+
+def flush_layout(frame):
+    """ Grids the widgets created for frame one per row in creation order, after any rows already in use, then lays the frame out once """
+    frame.grid_columnconfigure(0, weight=1)
+    row = frame.grid_size()[1]
+    remaining = []
+    for widget, grid_options in _pending:
+        if widget.master is frame:
+            widget.grid(row=row, **grid_options)
+            row += 1
+        else:
+            remaining.append((widget, grid_options))
+    _pending[:] = remaining
+    frame.update_idletasks()
+
+def build_form(frame, spec):
+    """
+    Creates a form from a list of widget specs, lays it out in one pass, and returns the created widget handles by name, e.g.
+
+        [
+            {'name': 'pd_entry', 'widget': 'entry', 'text': ''},
+            {'widget': 'button', 'text': 'Select Proteome CSV File', 'function': get_file_path, 'vars': 'pd_entry'},
+            {'name': 'll', 'widget': 'optionmenu', 'options': ['info', 'debug']}
+        ]
+
+    The remaining keys are passed to the matching create_* helper, a button's vars given as a string must name an earlier widget in the form
+    """
+    widgets = {}
+    for item in spec:
+        options = dict(item)
+        name = options.pop('name', None)
+        widget = options.pop('widget')
+        if widget == 'button' and isinstance(options.get('vars'), str):
+            # fail while building rather than when the button is clicked
+            if options['vars'] not in widgets:
+                raise KeyError(f'UNKNOWN WIDGET IN FORM: {options["vars"]}')
+            options['vars'] = widgets[options['vars']]
+        created = _BUILDERS[widget](frame, **options)
+        if name:
+            widgets[name] = created
+    flush_layout(frame)
+    return widgets
 
 def open_popup(root, title, text):
-    """ Opens a popup window with a given message """
-    popup = Toplevel(root)
+    """ Opens a popup window with a given message, reusing the root's popup window after the first call """
+    if root not in _popup_cache:
+        popup = Toplevel(root)
+        # closing the popup only hides it so it can be shown again
+        popup.protocol('WM_DELETE_WINDOW', popup.withdraw)
+
+        label = Label(popup)
+        label.pack(pady=20)
+        _popup_cache[root] = (popup, label)
+
+    popup, label = _popup_cache[root]
     popup.title(title)
+    label.config(text=text)
+    popup.deiconify()
+    popup.lift()
 
-    label = Label(popup, text=text)
-    label.pack(pady=20)
+def _get_dialog_root():
+    """ Returns a hidden root for standalone dialogs, created on first use and reused for the rest of the process """
+    global _dialog_root
+    if _dialog_root is None:
+        _dialog_root = Tk()
+        _dialog_root.withdraw()
+        atexit.register(_dialog_root.destroy)
+    return _dialog_root
 
-def get_file_path(entry):
-    """ Prompts for a user to select a file, returns the file path  """
-    Tk().withdraw()
-    file_path = askopenfilename()
-    entry.delete(0, END)
-    entry.insert(0, file_path)
+def get_file_path(entry=None, parent=None):
+    """
+    Prompts for a user to select a file, writes it to entry if one is given, and returns the file path
+    entry can be the handle returned by create_entry or a plain Entry widget
+    The dialog belongs to parent, defaulting to the entry's window, or to a shared hidden root when there is no entry
+    """
+    widget = entry.widget if isinstance(entry, WidgetHandle) else entry
+    if parent is None:
+        parent = widget.winfo_toplevel() if widget is not None else _get_dialog_root()
+
+    # imported on first use, the file dialog isn't needed to draw the main window
+    from tkinter.filedialog import Open
+    if parent not in _open_dialogs:
+        _open_dialogs[parent] = Open(parent=parent)
+    dialog = _open_dialogs[parent]
+    # the dialog remembers the last file picked, so keep its directory but not the file name, which belongs to another entry
+    dialog.options.pop('initialfile', None)
+    file_path = dialog.show()
+    if isinstance(entry, WidgetHandle):
+        entry.var.set(file_path)
+    elif widget is not None:
+        widget.delete(0, END)
+        widget.insert(0, file_path)
     return file_path
+
+_BUILDERS = {
+    'label': create_label,
+    'entry': create_entry,
+    'button': create_button,
+    'optionmenu': create_optionmenu,
+    'checkbox': create_checkbox
+}